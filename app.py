@@ -1,24 +1,29 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, abort
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, send_file, send_from_directory, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy.pool import QueuePool
 from werkzeug.utils import secure_filename
 
-from db import db, User, Project, Template, TemplateField, Submittal, Transmittal, DocumentFile, Attachment, Setting
-from docx_engine import extract_placeholders_from_docx, fill_docx_to_bytes
+from db import db, ensure_indexes, User, Project, Template, TemplateField, Submittal, Transmittal, DocumentFile, Attachment, Setting
+from docx_engine import extract_placeholders_from_docx, fill_docx_to_path, load_docx_template, fill_compiled_to_path
 from utils import (
     ensure_dirs, get_storage_root, set_storage_root,
     date_format_options, name_format_options, format_date, format_name,
     guess_field_type, parse_dropdown_options,
-    submittal_folder,
-    make_zip_for_submittal, export_logs_csv
+    submittal_folder, save_upload, save_uploads, stripped_form,
+    submittal_zip_entries, iter_zip, export_logs_csv, schedule_export_logs_csv
 )
 
 APP_PORT = int(os.environ.get("APP_PORT", "5001"))
 ALLOWED_TEMPLATE_EXT = {".docx"}
 ALLOWED_ATTACHMENT_EXT = {".pdf", ".docx", ".xlsx", ".xls", ".png", ".jpg", ".jpeg", ".txt", ".csv"}
+BATCH_COMMIT_EVERY = 500  # rows per transaction in batch_run
 BASE_DIR = Path(__file__).resolve().parent
 DB_DIR = BASE_DIR / "storage" / "db"
 DB_DIR.mkdir(parents=True, exist_ok=True)
@@ -28,6 +33,14 @@ def create_app():
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-secret-change-me")
     app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{(DB_DIR / 'hub.db').as_posix()}"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # keep SQLite connections open across requests (PRAGMAs are applied on connect in db.py)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "poolclass": QueuePool,
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_pre_ping": True,
+        "connect_args": {"check_same_thread": False, "timeout": 30},
+    }
 
     db.init_app(app)
 
@@ -42,24 +55,34 @@ def create_app():
     with app.app_context():
         ensure_dirs()
         db.create_all()
+        ensure_indexes()
         if not Setting.get("storage_root"):
             Setting.set("storage_root", str(Path.cwd() / "storage"))
 
     # -----------------------------
     # Setup / Auth
     # -----------------------------
+    # users are never deleted, so once one exists each worker can stop counting
+    setup_state = {"done": False}
+
+    def setup_done() -> bool:
+        if not setup_state["done"]:
+            setup_state["done"] = User.query.count() > 0
+        return setup_state["done"]
+
     @app.get("/setup")
     def setup():
-        if User.query.count() > 0:
+        if setup_done():
             return redirect(url_for("dashboard"))
         return render_template("setup.html")
 
     @app.post("/setup")
     def setup_post():
-        if User.query.count() > 0:
+        if setup_done():
             return redirect(url_for("dashboard"))
 
-        username = (request.form.get("username") or "").strip()
+        form = stripped_form()
+        username = form.get("username", "")
         password = request.form.get("password") or ""
         if not username or not password:
             flash("Username and password are required.", "danger")
@@ -69,19 +92,21 @@ def create_app():
         u.set_password(password)
         db.session.add(u)
         db.session.commit()
+        setup_state["done"] = True
         login_user(u)
         flash("Admin user created.", "success")
         return redirect(url_for("dashboard"))
 
     @app.get("/login")
     def login():
-        if User.query.count() == 0:
+        if not setup_done():
             return redirect(url_for("setup"))
         return render_template("login.html")
 
     @app.post("/login")
     def login_post():
-        username = (request.form.get("username") or "").strip()
+        form = stripped_form()
+        username = form.get("username", "")
         password = request.form.get("password") or ""
         u = User.query.filter_by(username=username).first()
         if not u or not u.check_password(password):
@@ -101,7 +126,7 @@ def create_app():
     # -----------------------------
     @app.get("/")
     def root():
-        if User.query.count() == 0:
+        if not setup_done():
             return redirect(url_for("setup"))
         if not current_user.is_authenticated:
             return redirect(url_for("login"))
@@ -121,9 +146,10 @@ def create_app():
     @app.post("/projects/new")
     @login_required
     def project_new_post():
-        name = (request.form.get("name") or "").strip()
-        contract_no = (request.form.get("contract_no") or "").strip()
-        project_number = (request.form.get("project_number") or "").strip()
+        form = stripped_form()
+        name = form.get("name", "")
+        contract_no = form.get("contract_no", "")
+        project_number = form.get("project_number", "")
         if not name:
             flash("Project name is required.", "danger")
             return redirect(url_for("project_new"))
@@ -146,16 +172,24 @@ def create_app():
     @login_required
     def project_view(project_id: int):
         p = db.session.get(Project, project_id) or abort(404)
-        submittals = Submittal.query.filter_by(project_id=p.id).order_by(Submittal.created_at.desc()).all()
+        # the list only renders these columns; skip hydrating notes etc.
+        submittals = (
+            Submittal.query
+            .options(load_only(Submittal.id, Submittal.sub_no, Submittal.title, Submittal.status, Submittal.disposition))
+            .filter_by(project_id=p.id)
+            .order_by(Submittal.created_at.desc())
+            .all()
+        )
         return render_template("project_view.html", project=p, submittals=submittals)
 
     @app.post("/projects/<int:project_id>/settings")
     @login_required
     def project_settings_save(project_id: int):
+        form = stripped_form()
         p = db.session.get(Project, project_id) or abort(404)
-        p.transmittal_prefix = (request.form.get("transmittal_prefix") or "T-").strip()
-        p.transmittal_padding = int(request.form.get("transmittal_padding") or "3")
-        p.revision_style = (request.form.get("revision_style") or "dot").strip()
+        p.transmittal_prefix = form.get("transmittal_prefix") or "T-"
+        p.transmittal_padding = int(form.get("transmittal_padding") or "3")
+        p.revision_style = form.get("revision_style") or "dot"
         db.session.commit()
         flash("Project settings saved.", "success")
         return redirect(url_for("project_view", project_id=p.id))
@@ -173,10 +207,11 @@ def create_app():
     @app.post("/projects/<int:project_id>/templates/upload")
     @login_required
     def template_upload(project_id: int):
+        form = stripped_form()
         p = db.session.get(Project, project_id) or abort(404)
         f = request.files.get("template")
-        t_type = (request.form.get("template_type") or "cover").strip()
-        name = (request.form.get("name") or "").strip() or f"{t_type.title()} Template"
+        t_type = form.get("template_type") or "cover"
+        name = form.get("name", "") or f"{t_type.title()} Template"
 
         if not f or not f.filename:
             flash("Choose a DOCX template to upload.", "danger")
@@ -192,8 +227,8 @@ def create_app():
         tpl_dir.mkdir(parents=True, exist_ok=True)
 
         filename = secure_filename(f.filename)
-        save_path = tpl_dir / f"{int(datetime.utcnow().timestamp())}_{filename}"
-        f.save(save_path)
+        save_path = tpl_dir / f"{int(time.time())}_{filename}"
+        save_upload(f, save_path)
 
         placeholders = extract_placeholders_from_docx(save_path)
         if not placeholders:
@@ -214,21 +249,21 @@ def create_app():
         db.session.add(tpl)
         db.session.commit()
 
-        # default field config
-        for idx, key in enumerate(placeholders):
-            ftype = guess_field_type(key)
-            tf = TemplateField(
-                template_id=tpl.id,
-                key=key,
-                label=key.replace("_", " "),
-                field_type=ftype,
-                required=False,
-                options_text="",
-                order_index=idx,
-                formatter=("date" if "date" in key.lower() else ("name" if "name" in key.lower() else "")),
-            )
-            db.session.add(tf)
-
+        # default field config (one executemany instead of an INSERT per placeholder)
+        rows = [
+            {
+                "template_id": tpl.id,
+                "key": key,
+                "label": key.replace("_", " "),
+                "field_type": guess_field_type(key),
+                "required": False,
+                "options_text": "",
+                "order_index": idx,
+                "formatter": ("date" if "date" in key.lower() else ("name" if "name" in key.lower() else "")),
+            }
+            for idx, key in enumerate(placeholders)
+        ]
+        db.session.bulk_insert_mappings(TemplateField, rows)
         db.session.commit()
         flash("Template uploaded. Configure fields if needed.", "success")
         return redirect(url_for("template_fields", template_id=tpl.id))
@@ -244,15 +279,16 @@ def create_app():
     @app.post("/templates/<int:template_id>/fields")
     @login_required
     def template_fields_save(template_id: int):
+        form = stripped_form()
         tpl = db.session.get(Template, template_id) or abort(404)
         fields = TemplateField.query.filter_by(template_id=tpl.id).all()
         for f in fields:
-            f.label = (request.form.get(f"label_{f.id}") or f.label).strip()
-            f.field_type = (request.form.get(f"type_{f.id}") or f.field_type).strip()
-            f.required = (request.form.get(f"required_{f.id}") == "on")
-            f.options_text = (request.form.get(f"options_{f.id}") or "").strip()
-            f.formatter = (request.form.get(f"formatter_{f.id}") or "").strip()
-            f.order_index = int(request.form.get(f"order_{f.id}") or f.order_index)
+            f.label = form.get(f"label_{f.id}") or f.label
+            f.field_type = form.get(f"type_{f.id}") or f.field_type
+            f.required = (form.get(f"required_{f.id}") == "on")
+            f.options_text = form.get(f"options_{f.id}", "")
+            f.formatter = form.get(f"formatter_{f.id}", "")
+            f.order_index = int(form.get(f"order_{f.id}") or f.order_index)
         db.session.commit()
         flash("Template fields saved.", "success")
         return redirect(url_for("template_fields", template_id=tpl.id))
@@ -293,30 +329,38 @@ def create_app():
         )
 
     def union_fields(template_ids):
+        # one query for all templates, then restore the per-template order before de-duping
+        tids = [tid for tid in template_ids if tid]
+        if not tids:
+            return []
+        rank = {tid: i for i, tid in enumerate(tids)}
+        rows = TemplateField.query.filter(TemplateField.template_id.in_(tids)).order_by(TemplateField.order_index.asc()).all()
+        rows.sort(key=lambda f: rank[f.template_id])
+
         fields = []
         seen = set()
-        for tid in template_ids:
-            if not tid:
-                continue
-            for f in TemplateField.query.filter_by(template_id=tid).order_by(TemplateField.order_index.asc()).all():
-                if f.key not in seen:
-                    f._options = parse_dropdown_options(f.options_text)
-                    fields.append(f)
-                    seen.add(f.key)
+        for f in rows:
+            if f.key not in seen:
+                f._options = parse_dropdown_options(f.options_text)
+                f._is_date = f.formatter == "date" or "date" in f.key.lower()
+                f._is_name = f.formatter == "name" or "name" in f.key.lower()
+                fields.append(f)
+                seen.add(f.key)
         return fields
 
     @app.post("/projects/<int:project_id>/submittals/new/fields")
     @login_required
     def submittal_new_step2(project_id: int):
+        form = stripped_form()
         p = db.session.get(Project, project_id) or abort(404)
 
-        cover_id = int(request.form.get("cover_template_id") or "0") or None
-        trans_id = int(request.form.get("trans_template_id") or "0") or None
+        cover_id = int(form.get("cover_template_id") or "0") or None
+        trans_id = int(form.get("trans_template_id") or "0") or None
         if not cover_id and not trans_id:
             flash("Select at least one template.", "danger")
             return redirect(url_for("submittal_new_step1", project_id=p.id))
 
-        sub_no = (request.form.get("sub_no") or "").strip()
+        sub_no = form.get("sub_no", "")
         if not sub_no:
             flash("Submittal No is required.", "danger")
             return redirect(url_for("submittal_new_step1", project_id=p.id))
@@ -332,9 +376,9 @@ def create_app():
             "Contract_No": p.contract_no or "",
             "Project_Number": p.project_number or "",
             "Sub_No": sub_no,
-            "Sub_Title": (request.form.get("title") or "").strip(),
-            "Spec_Section": (request.form.get("spec_section") or "").strip(),
-            "Authorization": (request.form.get("disposition") or "").strip(),
+            "Sub_Title": form.get("title", ""),
+            "Spec_Section": form.get("spec_section", ""),
+            "Authorization": form.get("disposition", ""),
         }
 
         return render_template("submittal_step2.html", project=p, fields=fields, carry=carry, defaults=defaults)
@@ -342,25 +386,26 @@ def create_app():
     @app.post("/projects/<int:project_id>/submittals/create")
     @login_required
     def submittal_create(project_id: int):
+        form = stripped_form()
         p = db.session.get(Project, project_id) or abort(404)
 
-        cover_id = int(request.form.get("cover_template_id") or "0") or None
-        trans_id = int(request.form.get("trans_template_id") or "0") or None
+        cover_id = int(form.get("cover_template_id") or "0") or None
+        trans_id = int(form.get("trans_template_id") or "0") or None
 
-        sub_no = (request.form.get("sub_no") or "").strip()
-        title = (request.form.get("title") or "").strip()
-        spec_section = (request.form.get("spec_section") or "").strip()
-        status = (request.form.get("status") or "Draft").strip()
-        disposition = (request.form.get("disposition") or "").strip()
-        responsible = (request.form.get("responsible") or "").strip()
-        notes = (request.form.get("notes") or "").strip()
+        sub_no = form.get("sub_no", "")
+        title = form.get("title", "")
+        spec_section = form.get("spec_section", "")
+        status = form.get("status") or "Draft"
+        disposition = form.get("disposition", "")
+        responsible = form.get("responsible", "")
+        notes = form.get("notes", "")
 
-        date_format_key = (request.form.get("date_format") or "mdy_slash").strip()
-        name_format_key = (request.form.get("name_format") or "first_last").strip()
+        date_format_key = form.get("date_format") or "mdy_slash"
+        name_format_key = form.get("name_format") or "first_last"
 
-        create_transmittal = (request.form.get("create_transmittal") == "on")
-        sent_to = (request.form.get("sent_to") or "").strip()
-        delivery_method = (request.form.get("delivery_method") or "").strip()
+        create_transmittal = (form.get("create_transmittal") == "on")
+        sent_to = form.get("sent_to", "")
+        delivery_method = form.get("delivery_method", "")
 
         if not sub_no:
             flash("Submittal No is required.", "danger")
@@ -398,7 +443,7 @@ def create_app():
         fields = union_fields([cover_id, trans_id])
         values = {}
         for f in fields:
-            values[f.key] = (request.form.get(f"field_{f.id}") or "").strip()
+            values[f.key] = form.get(f"field_{f.id}", "")
 
         auto_map = {
             "Project_Name": p.name,
@@ -409,15 +454,14 @@ def create_app():
             "Spec_Section": s.spec_section,
             "Authorization": s.disposition,
         }
-        for k, v in auto_map.items():
-            if k in values and not values[k]:
-                values[k] = v or ""
+        values.update({k: v or "" for k, v in auto_map.items() if k in values and not values[k]})
 
+        today = format_date(datetime.utcnow(), date_format_key)
         for f in fields:
-            if f.formatter == "date" or "date" in f.key.lower():
+            if f._is_date:
                 if not values.get(f.key, ""):
-                    values[f.key] = format_date(datetime.utcnow(), date_format_key)
-            if f.formatter == "name" or "name" in f.key.lower():
+                    values[f.key] = today
+            if f._is_name:
                 values[f.key] = format_name(values.get(f.key, ""), name_format_key)
 
         sub_dir = submittal_folder(p, s)
@@ -426,17 +470,30 @@ def create_app():
         gen_dir.mkdir(parents=True, exist_ok=True)
         att_dir.mkdir(parents=True, exist_ok=True)
 
-        def generate_doc(tpl_id, label):
-            if not tpl_id:
-                return None
-            tpl = db.session.get(Template, tpl_id)
-            if not tpl:
-                return None
-            doc_bytes = fill_docx_to_bytes(tpl.file_path, values)
-            out_path = gen_dir / f"{secure_filename(s.sub_no)}_{label}.docx"
-            out_path.write_bytes(doc_bytes.getvalue())
-
-            df = DocumentFile(
+        tpl_cover = db.session.get(Template, cover_id) if cover_id else None
+        tpl_trans = db.session.get(Template, trans_id) if trans_id else None
+
+        def render_doc(template_path, out_path):
+            # may run on a helper thread: no ORM access here
+            fill_docx_to_path(template_path, values, out_path)
+
+        outputs = [
+            (tpl.file_path, label, gen_dir / f"{secure_filename(s.sub_no)}_{label}.docx")
+            for tpl, label in ((tpl_cover, "CoverLetter"), (tpl_trans, "Transmittal"))
+            if tpl
+        ]
+        # the renders are independent: the second goes to a helper thread, the first runs here.
+        # No shared pool, so one slow render never holds up other users' requests.
+        # DocumentFile rows are added afterwards on this thread.
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            futs = [ex.submit(render_doc, template_path, out_path) for template_path, _, out_path in outputs[1:]]
+            for template_path, _, out_path in outputs[:1]:
+                render_doc(template_path, out_path)
+            for fut in futs:
+                fut.result()
+
+        db.session.add_all([
+            DocumentFile(
                 project_id=p.id,
                 submittal_id=s.id,
                 transmittal_id=(t.id if t else None),
@@ -444,43 +501,43 @@ def create_app():
                 file_path=str(out_path),
                 created_by_user_id=current_user.id,
             )
-            db.session.add(df)
-            db.session.commit()
-            return str(out_path)
-
-        generate_doc(cover_id, "CoverLetter")
-        generate_doc(trans_id, "Transmittal")
+            for _, label, out_path in outputs
+        ])
+        db.session.commit()
 
         # attachments
-        files = request.files.getlist("attachments")
-        for af in files:
+        uploads = []
+        for af in request.files.getlist("attachments"):
             if not af or not af.filename:
                 continue
             ext = Path(af.filename).suffix.lower()
             if ext and ext not in ALLOWED_ATTACHMENT_EXT:
                 continue
             fname = secure_filename(af.filename)
-            apath = att_dir / f"{int(datetime.utcnow().timestamp())}_{fname}"
-            af.save(apath)
-            a = Attachment(
+            # monotonic_ns suffix keeps same-second uploads of the same name apart
+            uploads.append((af, att_dir / f"{int(time.time())}_{time.monotonic_ns():x}_{fname}"))
+        save_uploads(uploads)
+        db.session.add_all([
+            Attachment(
                 project_id=p.id,
                 submittal_id=s.id,
                 original_filename=af.filename,
                 stored_path=str(apath),
                 uploaded_by_user_id=current_user.id,
             )
-            db.session.add(a)
+            for af, apath in uploads
+        ])
         db.session.commit()
 
-        export_logs_csv(p.id)
+        schedule_export_logs_csv(p.id)
         flash("Submittal created and documents generated.", "success")
         return redirect(url_for("submittal_view", submittal_id=s.id))
 
     @app.get("/submittals/<int:submittal_id>")
     @login_required
     def submittal_view(submittal_id: int):
-        s = db.session.get(Submittal, submittal_id) or abort(404)
-        p = db.session.get(Project, s.project_id) or abort(404)
+        s = db.session.get(Submittal, submittal_id, options=[joinedload(Submittal.project)]) or abort(404)
+        p = s.project or abort(404)
         docs = DocumentFile.query.filter_by(submittal_id=s.id).order_by(DocumentFile.created_at.desc()).all()
         atts = Attachment.query.filter_by(submittal_id=s.id).order_by(Attachment.uploaded_at.desc()).all()
         return render_template("submittal_view.html", project=p, submittal=s, docs=docs, attachments=atts)
@@ -491,16 +548,25 @@ def create_app():
         path = request.args.get("path")
         if not path:
             abort(400)
-        p = Path(path)
-        if not p.exists():
-            abort(404)
-        return send_file(p, as_attachment=True, download_name=p.name)
+        root = Path(get_storage_root()).resolve()
+        p = Path(path).resolve()
+        # the default DB_DIR sits inside the default storage root
+        if not p.is_relative_to(root) or p.is_relative_to(DB_DIR.resolve()):
+            abort(403)
+        return send_from_directory(root, p.relative_to(root).as_posix(), as_attachment=True, conditional=True)
 
     @app.get("/submittals/<int:submittal_id>/zip")
     @login_required
     def submittal_zip(submittal_id: int):
-        zip_path = make_zip_for_submittal(submittal_id)
-        return send_file(zip_path, as_attachment=True, download_name=Path(zip_path).name)
+        s = db.session.get(Submittal, submittal_id, options=[joinedload(Submittal.project)]) or abort(404)
+        p = s.project or abort(404)
+        entries = submittal_zip_entries(p, s)
+        name = f"{secure_filename(p.name)}_{secure_filename(s.sub_no)}.zip"
+        return Response(
+            iter_zip(entries),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{name}"'},
+        )
 
     # logs export
     @app.get("/projects/<int:project_id>/export/submittal_log.csv")
@@ -529,11 +595,14 @@ def create_app():
     @login_required
     def batch_run(project_id: int):
         import csv
+        import io
+        from itertools import chain
 
+        form = stripped_form()
         p = db.session.get(Project, project_id) or abort(404)
 
-        cover_id = int(request.form.get("cover_template_id") or "0") or None
-        trans_id = int(request.form.get("trans_template_id") or "0") or None
+        cover_id = int(form.get("cover_template_id") or "0") or None
+        trans_id = int(form.get("trans_template_id") or "0") or None
         if not cover_id and not trans_id:
             flash("Select at least one template.", "danger")
             return redirect(url_for("batch_page", project_id=p.id))
@@ -543,88 +612,103 @@ def create_app():
             flash("Upload a CSV.", "danger")
             return redirect(url_for("batch_page", project_id=p.id))
 
-        date_format_key = (request.form.get("date_format") or "mdy_slash").strip()
-        name_format_key = (request.form.get("name_format") or "first_last").strip()
-
-        content = f.stream.read().decode("utf-8-sig", errors="replace").splitlines()
-        reader = csv.DictReader(content)
-        rows = list(reader)
-
-        if not rows:
+        date_format_key = form.get("date_format") or "mdy_slash"
+        name_format_key = form.get("name_format") or "first_last"
+
+        # stream rows straight off the upload instead of materializing the whole CSV.
+        # SpooledTemporaryFile only has readable() (needed by TextIOWrapper) from 3.11; wrap its file then
+        raw = f.stream
+        if not hasattr(raw, "readable"):
+            raw = raw._file
+        reader = csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline=""))
+        first = next(reader, None)
+        if first is None:
             flash("CSV had no rows.", "danger")
             return redirect(url_for("batch_page", project_id=p.id))
+        rows = chain([first], reader)
 
         fields = union_fields([cover_id, trans_id])
         field_keys = [ff.key for ff in fields]
-
+        tpl_cover = db.session.get(Template, cover_id) if cover_id else None
+        tpl_trans = db.session.get(Template, trans_id) if trans_id else None
+        # parse each DOCX once; every row renders from a copy
+        compiled_cover = load_docx_template(tpl_cover.file_path) if tpl_cover else None
+        compiled_trans = load_docx_template(tpl_trans.file_path) if tpl_trans else None
+
+        today = format_date(datetime.utcnow(), date_format_key)
+        project_auto = {
+            "Project_Name": p.name,
+            "Contract_No": p.contract_no,
+            "Project_Number": p.project_number,
+        }
         created = 0
-        for r in rows:
-            sub_no = (r.get("Sub_No") or r.get("sub_no") or "").strip()
-            if not sub_no:
-                continue
-
-            s = Submittal(
-                project_id=p.id,
-                sub_no=sub_no,
-                title=(r.get("Sub_Title") or r.get("Title") or "").strip(),
-                spec_section=(r.get("Spec_Section") or "").strip(),
-                status=(r.get("Status") or "Draft").strip(),
-                disposition=(r.get("Disposition") or "").strip(),
-                responsible_person=(r.get("Responsible") or "").strip(),
-                notes=(r.get("Notes") or "").strip(),
-                created_by_user_id=current_user.id,
-            )
-            db.session.add(s)
-            db.session.commit()
-
-            values = {k: (r.get(k) or "").strip() for k in field_keys}
+        try:
+            for r in rows:
+                sub_no = (r.get("Sub_No") or r.get("sub_no") or "").strip()
+                if not sub_no:
+                    continue
 
-            auto_map = {
-                "Project_Name": p.name,
-                "Contract_No": p.contract_no,
-                "Project_Number": p.project_number,
-                "Sub_No": s.sub_no,
-                "Sub_Title": s.title,
-                "Spec_Section": s.spec_section,
-                "Authorization": s.disposition,
-            }
-            for k, v in auto_map.items():
-                if k in values and not values[k]:
-                    values[k] = v or ""
-
-            for ff in fields:
-                if ff.formatter == "date" or "date" in ff.key.lower():
-                    if not values.get(ff.key, ""):
-                        values[ff.key] = format_date(datetime.utcnow(), date_format_key)
-                if ff.formatter == "name" or "name" in ff.key.lower():
-                    values[ff.key] = format_name(values.get(ff.key, ""), name_format_key)
-
-            sub_dir = submittal_folder(p, s)
-            gen_dir = sub_dir / "Generated"
-            gen_dir.mkdir(parents=True, exist_ok=True)
-
-            def gen(tpl_id, label):
-                if not tpl_id:
-                    return
-                tpl = db.session.get(Template, tpl_id)
-                doc_bytes = fill_docx_to_bytes(tpl.file_path, values)
-                out_path = gen_dir / f"{secure_filename(s.sub_no)}_{label}.docx"
-                out_path.write_bytes(doc_bytes.getvalue())
-                df = DocumentFile(
+                s = Submittal(
                     project_id=p.id,
-                    submittal_id=s.id,
-                    doc_type=label,
-                    file_path=str(out_path),
+                    sub_no=sub_no,
+                    title=(r.get("Sub_Title") or r.get("Title") or "").strip(),
+                    spec_section=(r.get("Spec_Section") or "").strip(),
+                    status=(r.get("Status") or "Draft").strip(),
+                    disposition=(r.get("Disposition") or "").strip(),
+                    responsible_person=(r.get("Responsible") or "").strip(),
+                    notes=(r.get("Notes") or "").strip(),
                     created_by_user_id=current_user.id,
                 )
-                db.session.add(df)
-                db.session.commit()
-
-            gen(cover_id, "CoverLetter")
-            gen(trans_id, "Transmittal")
-            created += 1
+                db.session.add(s)
+                db.session.flush()  # need s.id for the DocumentFile rows
+
+                values = {k: (r.get(k) or "").strip() for k in field_keys}
+
+                auto_map = {
+                    **project_auto,
+                    "Sub_No": s.sub_no,
+                    "Sub_Title": s.title,
+                    "Spec_Section": s.spec_section,
+                    "Authorization": s.disposition,
+                }
+                values.update({k: v or "" for k, v in auto_map.items() if k in values and not values[k]})
+
+                for ff in fields:
+                    if ff._is_date:
+                        if not values.get(ff.key, ""):
+                            values[ff.key] = today
+                    if ff._is_name:
+                        values[ff.key] = format_name(values.get(ff.key, ""), name_format_key)
+
+                sub_dir = submittal_folder(p, s)
+                gen_dir = sub_dir / "Generated"
+                gen_dir.mkdir(parents=True, exist_ok=True)
+
+                def gen(compiled, label):
+                    if compiled is None:
+                        return
+                    out_path = gen_dir / f"{secure_filename(s.sub_no)}_{label}.docx"
+                    fill_compiled_to_path(compiled, values, out_path)
+                    df = DocumentFile(
+                        project_id=p.id,
+                        submittal_id=s.id,
+                        doc_type=label,
+                        file_path=str(out_path),
+                        created_by_user_id=current_user.id,
+                    )
+                    db.session.add(df)
+
+                gen(compiled_cover, "CoverLetter")
+                gen(compiled_trans, "Transmittal")
+                created += 1
+                if created % BATCH_COMMIT_EVERY == 0:
+                    db.session.commit()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
-        export_logs_csv(p.id)
+        schedule_export_logs_csv(p.id)
         flash(f"Batch complete: created {created} submittals.", "success")
         return redirect(url_for("project_view", project_id=p.id))
 
@@ -645,9 +729,10 @@ def create_app():
         if not current_user.is_admin:
             abort(403)
 
-        username = (request.form.get("username") or "").strip()
+        form = stripped_form()
+        username = form.get("username", "")
         password = request.form.get("password") or ""
-        role = (request.form.get("role") or "editor").strip()
+        role = form.get("role") or "editor"
 
         if not username or not password:
             flash("Username and password required.", "danger")
@@ -676,7 +761,8 @@ def create_app():
     @app.post("/settings")
     @login_required
     def settings_save():
-        storage_root = (request.form.get("storage_root") or "").strip()
+        form = stripped_form()
+        storage_root = form.get("storage_root", "")
         if not storage_root:
             flash("Storage root cannot be empty.", "danger")
             return redirect(url_for("settings_page"))
@@ -1,11 +1,43 @@
+import sqlite3
 from datetime import datetime
 from typing import Optional
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+# one session per request/app context, so nothing outlives it: skip re-SELECTing every
+# loaded object after a commit just to render a redirect or the next template
+db = SQLAlchemy(session_options={"expire_on_commit": False})
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+)
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # runs once per pooled connection, not per request
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cur = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
+
+
+def ensure_indexes() -> None:
+    # create_all() skips tables that already exist, so add any newer indexes to old DBs
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
 
 
 class Setting(db.Model):
@@ -15,20 +47,34 @@ class Setting(db.Model):
 
     @staticmethod
     def get(key: str) -> Optional[str]:
-        obj = Setting.query.filter_by(key=key).first()
-        return obj.value if obj else None
+        return db.session.execute(select(Setting.value).where(Setting.key == key)).scalar()
 
     @staticmethod
     def set(key: str, value: str) -> None:
-        obj = Setting.query.filter_by(key=key).first()
-        if not obj:
-            obj = Setting(key=key, value=value)
-            db.session.add(obj)
-        else:
-            obj.value = value
+        stmt = sqlite_insert(Setting).values(key=key, value=value)
+        stmt = stmt.on_conflict_do_update(index_elements=[Setting.key], set_={"value": stmt.excluded.value})
+        db.session.execute(stmt)
         db.session.commit()
 
 
+PBKDF2_MIN_ITERS = 600_000  # OWASP floor for PBKDF2-SHA256
+
+
+def password_hash_method() -> Optional[str]:
+    """
+    None (werkzeug's default hasher) unless the "pbkdf2_iters" setting pins
+    PBKDF2-SHA256 to a specific cost, never below PBKDF2_MIN_ITERS.
+    Existing hashes carry their own method, so checks keep working.
+    """
+    try:
+        iters = int(Setting.get("pbkdf2_iters") or 0)
+    except ValueError:
+        iters = 0
+    if iters <= 0:
+        return None
+    return f"pbkdf2:sha256:{max(iters, PBKDF2_MIN_ITERS)}"
+
+
 class User(UserMixin, db.Model):
     __tablename__ = "users"
     id = db.Column(db.Integer, primary_key=True)
@@ -42,7 +88,11 @@ class User(UserMixin, db.Model):
         return self.role == "admin"
 
     def set_password(self, password: str):
-        self.password_hash = generate_password_hash(password)
+        method = password_hash_method()
+        if method is None:
+            self.password_hash = generate_password_hash(password)
+        else:
+            self.password_hash = generate_password_hash(password, method=method)
 
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password)
@@ -78,15 +128,20 @@ class Project(db.Model):
         ]
 
     def make_next_transmittal_no(self) -> str:
-        seq = int(self.next_transmittal_seq or 1)
-        trans_no = f"{self.transmittal_prefix}{str(seq).zfill(int(self.transmittal_padding or 3))}"
-        self.next_transmittal_seq = seq + 1
-        db.session.commit()
-        return trans_no
+        # claim the number with one atomic UPDATE ... RETURNING; the caller commits
+        next_seq = db.session.execute(
+            update(Project)
+            .where(Project.id == self.id)
+            .values(next_transmittal_seq=func.coalesce(Project.next_transmittal_seq, 1) + 1)
+            .returning(Project.next_transmittal_seq)
+        ).scalar_one()
+        seq = next_seq - 1
+        return f"{self.transmittal_prefix}{str(seq).zfill(int(self.transmittal_padding or 3))}"
 
 
 class Template(db.Model):
     __tablename__ = "templates"
+    __table_args__ = (db.Index("ix_templates_project_created", "project_id", "created_at"),)
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
     name = db.Column(db.String(240), nullable=False)
@@ -99,7 +154,7 @@ class Template(db.Model):
 class TemplateField(db.Model):
     __tablename__ = "template_fields"
     id = db.Column(db.Integer, primary_key=True)
-    template_id = db.Column(db.Integer, db.ForeignKey("templates.id"), nullable=False)
+    template_id = db.Column(db.Integer, db.ForeignKey("templates.id"), nullable=False, index=True)
 
     # placeholder key WITHOUT « »
     key = db.Column(db.String(240), nullable=False)
@@ -114,6 +169,7 @@ class TemplateField(db.Model):
 
 class Submittal(db.Model):
     __tablename__ = "submittals"
+    __table_args__ = (db.Index("ix_submittals_project_created", "project_id", "created_at"),)
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
 
@@ -129,11 +185,13 @@ class Submittal(db.Model):
     created_by_user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    project = db.relationship("Project")
+
 
 class Transmittal(db.Model):
     __tablename__ = "transmittals"
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False, index=True)
 
     trans_no = db.Column(db.String(120), nullable=False)
     date_sent = db.Column(db.DateTime, nullable=True)
@@ -147,10 +205,11 @@ class Transmittal(db.Model):
 
 class DocumentFile(db.Model):
     __tablename__ = "documents"
+    __table_args__ = (db.Index("ix_documents_submittal_created", "submittal_id", "created_at"),)
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False, index=True)
     submittal_id = db.Column(db.Integer, db.ForeignKey("submittals.id"), nullable=True)
-    transmittal_id = db.Column(db.Integer, db.ForeignKey("transmittals.id"), nullable=True)
+    transmittal_id = db.Column(db.Integer, db.ForeignKey("transmittals.id"), nullable=True, index=True)
 
     doc_type = db.Column(db.String(60), nullable=False)  # CoverLetter / Transmittal / etc
     file_path = db.Column(db.Text, nullable=False)
@@ -161,8 +220,9 @@ class DocumentFile(db.Model):
 
 class Attachment(db.Model):
     __tablename__ = "attachments"
+    __table_args__ = (db.Index("ix_attachments_submittal_uploaded", "submittal_id", "uploaded_at"),)
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey("projects.id"), nullable=False, index=True)
     submittal_id = db.Column(db.Integer, db.ForeignKey("submittals.id"), nullable=False)
 
     original_filename = db.Column(db.String(255), nullable=False)
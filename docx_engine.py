@@ -1,145 +1,238 @@
+import copy
+import os
 import re
+import threading
+import zipfile
+from bisect import bisect_right
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
 from typing import Dict
 
 from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.oxml.parser import parse_xml
+from docx.text.paragraph import Paragraph
 
 PLACEHOLDER_RE = re.compile(r"«([^»]+)»")  # captures inside «...»
+TOKEN_RE = re.compile(r"«[^«»]+»")  # whole token, for one-pass replacement
 WHOLE_PLACEHOLDER_PARA_RE = re.compile(r"^\s*(?:«[^»]+»\s*)+$")
-BULLET_ONLY_RE = re.compile(r"^[•\-\u2013\u2014]\s*$")  # • - – —
+BULLET_CHARS = frozenset("•-\u2013\u2014")  # • - – —, a line holding only one of these is a leftover bullet
+XML_PART_RE = re.compile(r"^word/(?:document|header\d*|footer\d*)\.xml$")
 
+# text-box paragraphs are left alone, as before: deleting one can leave an invalid empty w:txbxContent
+PARAGRAPH_XPATH = ".//w:p[not(ancestor::w:txbxContent)]"
+HEADER_FOOTER_RELTYPES = (RT.HEADER, RT.FOOTER)
+KEEP_LAST_PARAGRAPH_TAGS = {qn("w:tc"), qn("w:hdr"), qn("w:ftr")}
+W_P = qn("w:p")
 
-def iter_paragraphs(container):
-    for p in getattr(container, "paragraphs", []):
-        yield p
-    for table in getattr(container, "tables", []):
-        for row in table.rows:
-            for cell in row.cells:
-                yield from iter_paragraphs(cell)
+_render_buffers = threading.local()
 
 
 def iter_all_paragraphs(doc: Document):
-    yield from iter_paragraphs(doc)
-    for sec in doc.sections:
-        yield from iter_paragraphs(sec.header)
-        yield from iter_paragraphs(sec.footer)
-        yield from iter_paragraphs(sec.first_page_header)
-        yield from iter_paragraphs(sec.first_page_footer)
-        yield from iter_paragraphs(sec.even_page_header)
-        yield from iter_paragraphs(sec.even_page_footer)
+    """
+    Every paragraph in the body (tables at any depth included) and in the headers/footers
+    the document actually has: one XPath per part instead of walking table/row/cell
+    wrappers. Going through the rels also avoids section.header/footer, which adds an
+    empty header part whenever one is missing.
+    """
+    parts = [doc.part] + [
+        rel.target_part for rel in doc.part.rels.values()
+        if rel.reltype in HEADER_FOOTER_RELTYPES and not rel.is_external
+    ]
+    for part in parts:
+        for p in part.element.xpath(PARAGRAPH_XPATH):
+            yield Paragraph(p, part)
 
 
 def extract_placeholders_from_docx(path: str | Path):
-    doc = Document(str(path))
+    path = str(path)
+    return list(_extract_placeholders_cached(path, os.stat(path).st_mtime_ns))
+
+
+@lru_cache(maxsize=64)
+def _extract_placeholders_cached(path: str, mtime_ns: int):
+    # read-only, so skip the Document/package wrappers: parse the body/header/footer XML
+    # with python-docx's element classes and take the same paragraphs and p.text the fill sees
     found = set()
-    for p in iter_all_paragraphs(doc):
-        for name in PLACEHOLDER_RE.findall(p.text):
-            found.add(name.strip())
-    return sorted(found)
+    with zipfile.ZipFile(path) as z:
+        for name in z.namelist():
+            if not XML_PART_RE.match(name):
+                continue
+            for p in parse_xml(z.read(name)).xpath(PARAGRAPH_XPATH):
+                found.update(m.group(1).strip() for m in PLACEHOLDER_RE.finditer(p.text))
+    return tuple(sorted(found))
 
 
-def delete_paragraph(paragraph):
-    p = paragraph._element
-    parent = p.getparent()
-    if parent is not None:
+def delete_paragraphs(elements):
+    """
+    Detach the given <w:p> elements; done after the cleanup pass has decided on
+    every paragraph so the tree isn't mutated while it is still being inspected.
+    A table cell, header or footer must end in a paragraph (Word rejects the file
+    otherwise), so one left without gets a plain empty <w:p/>, not a leftover bullet.
+    """
+    containers = set()
+    for p in elements:
+        parent = p.getparent()
+        if parent is None:
+            continue
         parent.remove(p)
+        if parent.tag in KEEP_LAST_PARAGRAPH_TAGS:
+            containers.add(parent)
+    for parent in containers:
+        if len(parent) == 0 or parent[-1].tag != W_P:
+            parent.append(OxmlElement("w:p"))
 
 
-def replace_token_across_runs(paragraph, token: str, replacement: str):
+def replace_tokens_across_runs(paragraph, token_map: Dict[str, str]):
     """
-    Replace token across Word runs while preserving surrounding formatting.
+    Replace every «token» in token_map across Word runs while preserving surrounding formatting.
     Word often splits text into separate runs when formatting changes.
+    The paragraph text is scanned once; a replacement lands in the run where its token
+    started, runs fully covered by a token are emptied, and untouched runs are left as is.
     """
-    if not paragraph.runs:
+    runs = paragraph.runs
+    if not runs:
         return
 
-    while True:
-        full = "".join(r.text for r in paragraph.runs)
-        idx = full.find(token)
-        if idx == -1:
-            break
+    texts = [r.text for r in runs]
+    full = "".join(texts)
+    matches = [m for m in TOKEN_RE.finditer(full) if m.group(0) in token_map]
+    if not matches:
+        return
 
-        start = idx
-        end = idx + len(token)
+    starts = []
+    pos = 0
+    for t in texts:
+        starts.append(pos)
+        pos += len(t)
 
-        pos = 0
-        start_run = end_run = None
-        start_off = end_off = 0
+    pieces = [[] for _ in runs]
 
-        for i, r in enumerate(paragraph.runs):
-            next_pos = pos + len(r.text)
+    def keep(a, b):
+        # copy full[a:b] back into the runs it came from
+        i = bisect_right(starts, a) - 1
+        while a < b:
+            seg_end = min(b, starts[i] + len(texts[i]))
+            pieces[i].append(full[a:seg_end])
+            a = seg_end
+            i += 1
 
-            if start_run is None and start < next_pos:
-                start_run = i
-                start_off = start - pos
+    cursor = 0
+    for m in matches:
+        keep(cursor, m.start())
+        pieces[bisect_right(starts, m.start()) - 1].append(token_map[m.group(0)])
+        cursor = m.end()
+    keep(cursor, len(full))
 
-            if start_run is not None and end <= next_pos:
-                end_run = i
-                end_off = end - pos
-                break
+    for r, old, parts in zip(runs, texts, pieces):
+        new = "".join(parts)
+        if new != old:
+            r.text = new
 
-            pos = next_pos
 
-        if start_run is None or end_run is None:
-            break
+@lru_cache(maxsize=32)
+def _load_docx_cached(path: str, mtime_ns: int):
+    return Document(path)
 
-        if start_run == end_run:
-            r = paragraph.runs[start_run]
-            r.text = r.text[:start_off] + replacement + r.text[end_off:]
-        else:
-            first = paragraph.runs[start_run]
-            last = paragraph.runs[end_run]
 
-            first.text = first.text[:start_off] + replacement
-            for j in range(start_run + 1, end_run):
-                paragraph.runs[j].text = ""
-            last.text = last.text[end_off:]
+def load_docx_template(path: str | Path):
+    """
+    Parse a template once and reuse it; keyed by mtime so a replaced file is re-read.
+    The returned Document is shared - don't even read from it, only pass it to the
+    fill_compiled*() functions. python-docx caches lxml sub-elements on its wrappers
+    (e.g. Document._body) and deepcopy would copy those as detached trees.
+    """
+    path = str(path)
+    return _load_docx_cached(path, os.stat(path).st_mtime_ns)
 
 
 def fill_docx_to_bytes(template_path: str | Path, values: Dict[str, str]) -> BytesIO:
     """
     values keys must be placeholder keys WITHOUT angle markers.
     """
-    doc = Document(str(template_path))
+    return fill_compiled(load_docx_template(template_path), values)
+
+
+def fill_docx_to_path(template_path: str | Path, values: Dict[str, str], out_path: str | Path) -> None:
+    """
+    One-off render straight to out_path; unlike fill_compiled_to_path() it keeps no
+    per-thread buffer alive, since request threads would hold it indefinitely.
+    """
+    _fill_document(load_docx_template(template_path), values).save(str(out_path))
+
+
+def fill_compiled(compiled, values: Dict[str, str]) -> BytesIO:
+    """
+    Fill a Document from load_docx_template() without touching the cached original.
+    """
+    out = BytesIO()
+    _fill_document(compiled, values).save(out)
+    out.seek(0)
+    return out
+
+
+def fill_compiled_to_path(compiled, values: Dict[str, str], out_path: str | Path) -> None:
+    """
+    Like fill_compiled(), but serializes into a per-thread buffer that is reused
+    across renders and written out with a single write.
+    """
+    buf = getattr(_render_buffers, "buf", None)
+    if buf is None:
+        buf = _render_buffers.buf = BytesIO()
+    # no truncate(): it can shrink the allocation; only the first `size` bytes are ours
+    buf.seek(0)
+    _fill_document(compiled, values).save(buf)
+    size = buf.tell()
+    with buf.getbuffer() as view, view[:size] as data, open(out_path, "wb") as f:
+        f.write(data)
+
+
+def _fill_document(compiled, values: Dict[str, str]):
+    doc = copy.deepcopy(compiled)
     token_map = {f"«{k}»": (values.get(k, "") or "") for k in values.keys()}
 
-    # keep original text to decide if a paragraph was only placeholders
-    original_texts = {}
+    # one walk: keep each paragraph with whether it was ONLY placeholders before filling,
+    # and clean up the same wrappers afterwards instead of walking the tree again.
+    # p.text re-joins every run, so it is read once here and only again if we changed it.
+    items = []
     for p in iter_all_paragraphs(doc):
-        original_texts[id(p)] = p.text
-        for token, replacement in token_map.items():
-            if token in p.text:
-                replace_token_across_runs(p, token, replacement)
+        text = p.text
+        if "«" not in text:
+            items.append((p, text, False))  # static prose, headers, etc.: text stays as is
+            continue
+        items.append((p, None, bool(WHOLE_PLACEHOLDER_PARA_RE.match(text.strip()))))
+        replace_tokens_across_runs(p, token_map)
 
     # Cleanup pass
-    for p in list(iter_all_paragraphs(doc)):
-        original = (original_texts.get(id(p)) or "")
-        now = (p.text or "").strip()
-
-        # remove bullet-only lines and empty list-style lines
-        style_name = ""
-        try:
-            style_name = (p.style.name or "").lower()
-        except Exception:
-            style_name = ""
+    to_remove = []
+    for p, text, was_placeholder_only in items:
+        now = (p.text if text is None else text).strip()
 
-        is_listish = ("list" in style_name) or ("bullet" in style_name)
-
-        if BULLET_ONLY_RE.match((p.text or "").strip()):
-            delete_paragraph(p)
+        # remove bullet-only lines
+        if now in BULLET_CHARS:
+            to_remove.append(p._element)
             continue
 
-        if now == "" and is_listish:
-            delete_paragraph(p)
+        if now != "":
             continue
 
         # remove paragraphs that were ONLY placeholders (and now empty)
-        if now == "" and WHOLE_PLACEHOLDER_PARA_RE.match(original.strip() or ""):
-            delete_paragraph(p)
+        if was_placeholder_only:
+            to_remove.append(p._element)
             continue
 
-    out = BytesIO()
-    doc.save(out)
-    out.seek(0)
-    return out
+        # remove empty list-style lines; style lookup only for the empty ones
+        style_name = ""
+        try:
+            style_name = (p.style.name or "").lower()
+        except Exception:
+            style_name = ""
+
+        if ("list" in style_name) or ("bullet" in style_name):
+            to_remove.append(p._element)
+
+    delete_paragraphs(to_remove)
+    return doc
@@ -5,57 +5,79 @@ SAMPLE_DIR = Path("sample_templates")
 SAMPLE_DIR.mkdir(parents=True, exist_ok=True)
 
 
+def paragraph_writer(doc):
+    """
+    Returns (add, finish). add() inserts before a single trailing leader paragraph,
+    which stays cheap however long the document gets (add_paragraph() slows down
+    as the body grows); finish() drops the leader.
+    """
+    leader = doc.add_paragraph()
+
+    def add(text: str = "", style=None):
+        return leader.insert_paragraph_before(text, style=style)
+
+    def finish():
+        p = leader._element
+        p.getparent().remove(p)
+
+    return add, finish
+
+
 def make_cover_letter(path: Path):
     doc = Document()
-    doc.add_paragraph("«Company_Name»")
-    doc.add_paragraph("«Address_Line»")
-    doc.add_paragraph("«City_State_Zip_Code»")
-    doc.add_paragraph("")
+    add, finish = paragraph_writer(doc)
+    add("«Company_Name»")
+    add("«Address_Line»")
+    add("«City_State_Zip_Code»")
+    add("")
 
-    doc.add_paragraph("Date: «Date_»")
-    doc.add_paragraph("")
-    doc.add_paragraph("To: «Project_Engineer_Contractor_Name»")
-    doc.add_paragraph("Project: «Project_Name»")
-    doc.add_paragraph("Contract No: «Contract_No»    Project No: «Project_Number»")
-    doc.add_paragraph("")
+    add("Date: «Date_»")
+    add("")
+    add("To: «Project_Engineer_Contractor_Name»")
+    add("Project: «Project_Name»")
+    add("Contract No: «Contract_No»    Project No: «Project_Number»")
+    add("")
 
-    doc.add_paragraph("RE: Submittal «Sub_No» — «Sub_Title» (Spec Section: «Spec_Section»)")
+    add("RE: Submittal «Sub_No» — «Sub_Title» (Spec Section: «Spec_Section»)")
 
-    doc.add_paragraph("")
-    doc.add_paragraph("Dear «Project_Engineer_Contractor_Name»,")
+    add("")
+    add("Dear «Project_Engineer_Contractor_Name»,")
 
-    doc.add_paragraph("")
-    doc.add_paragraph("Please review the following submittal:")
+    add("")
+    add("Please review the following submittal:")
 
     # bullet list placeholders (auto-deletes if blank)
     for i in range(1, 6):
-        doc.add_paragraph(f"«BulletedInfo{i}»", style="List Bullet")
+        add(f"«BulletedInfo{i}»", style="List Bullet")
 
-    doc.add_paragraph("")
-    doc.add_paragraph("Disposition / Authorization Requested: «Authorization»")
-    doc.add_paragraph("")
+    add("")
+    add("Disposition / Authorization Requested: «Authorization»")
+    add("")
 
-    doc.add_paragraph("Sincerely,")
-    doc.add_paragraph("«Project_Manager_Name»")
-    doc.add_paragraph("«Sender_Title»")
+    add("Sincerely,")
+    add("«Project_Manager_Name»")
+    add("«Sender_Title»")
 
+    finish()
     doc.save(path)
 
 
 def make_transmittal(path: Path):
     doc = Document()
-    doc.add_paragraph("TRANSMITTAL", style="Title")
-    doc.add_paragraph("")
-    doc.add_paragraph("Project: «Project_Name»")
-    doc.add_paragraph("Submittal No: «Sub_No»")
-    doc.add_paragraph("Date: «Date_»")
-    doc.add_paragraph("To: «Project_Engineer_Contractor_Name»")
-    doc.add_paragraph("")
-    doc.add_paragraph("Items transmitted:")
+    add, finish = paragraph_writer(doc)
+    add("TRANSMITTAL", style="Title")
+    add("")
+    add("Project: «Project_Name»")
+    add("Submittal No: «Sub_No»")
+    add("Date: «Date_»")
+    add("To: «Project_Engineer_Contractor_Name»")
+    add("")
+    add("Items transmitted:")
     for i in range(1, 6):
-        doc.add_paragraph(f"«BulletedInfo{i}»", style="List Bullet")
-    doc.add_paragraph("")
-    doc.add_paragraph("Sent by: «Project_Manager_Name»")
+        add(f"«BulletedInfo{i}»", style="List Bullet")
+    add("")
+    add("Sent by: «Project_Manager_Name»")
+    finish()
     doc.save(path)
 
 
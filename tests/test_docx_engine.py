@@ -0,0 +1,65 @@
+from docx import Document
+from docx.oxml.ns import nsdecls, qn
+from docx.oxml.parser import parse_xml
+
+from docx_engine import extract_placeholders_from_docx, fill_docx_to_bytes
+
+
+def _bullet_cell_template(path):
+    doc = Document()
+    table = doc.add_table(rows=1, cols=2)
+    items = table.cell(0, 0)
+    items.paragraphs[0].text = "Items:"
+    for key in ("B1", "B2", "B3"):
+        items.add_paragraph(f"«{key}»", style="List Bullet")
+    only = table.cell(0, 1).paragraphs[0]
+    only.text = "«C1»"
+    only.style = "List Bullet"
+    header = doc.sections[0].header
+    header.paragraphs[0].text = "Head"
+    header.add_paragraph("«H1»")
+    doc.save(path)
+
+
+def test_blank_trailing_bullets_in_cell_are_removed(tmp_path):
+    path = tmp_path / "t.docx"
+    _bullet_cell_template(path)
+    out = Document(fill_docx_to_bytes(path, {"B1": "one", "B2": "", "B3": "", "C1": "x", "H1": ""}))
+
+    cell = out.tables[0].cell(0, 0)
+    assert [(p.text, p.style.name) for p in cell.paragraphs] == [("Items:", "Normal"), ("one", "List Bullet")]
+    assert [p.text for p in out.sections[0].header.paragraphs] == ["Head"]
+
+
+def test_all_blank_cell_keeps_a_plain_paragraph(tmp_path):
+    path = tmp_path / "t.docx"
+    _bullet_cell_template(path)
+    out = Document(fill_docx_to_bytes(path, {"B1": "", "B2": "", "B3": "", "C1": "", "H1": ""}))
+
+    cell = out.tables[0].cell(0, 1)
+    # Word rejects a <w:tc> that doesn't end in a paragraph; it must not be a bullet either
+    assert cell._tc[-1].tag == qn("w:p")
+    assert [(p.text, p.style.name) for p in cell.paragraphs] == [("", "Normal")]
+    assert cell.paragraphs[0]._p.pPr is None
+
+
+def test_extraction_only_reports_placeholders_the_fill_replaces(tmp_path):
+    doc = Document()
+    doc.add_paragraph("«Sub_No»")
+    p = doc.add_paragraph("CC: ")._p
+    # content controls, tracked insertions and text boxes aren't p.text/runs, so the fill never sees them
+    p.append(parse_xml(
+        f'<w:sdt {nsdecls("w")}><w:sdtContent><w:r><w:t>«InSdt»</w:t></w:r></w:sdtContent></w:sdt>'
+    ))
+    p.append(parse_xml(f'<w:ins {nsdecls("w")} w:id="1" w:author="a"><w:r><w:t>«Inserted»</w:t></w:r></w:ins>'))
+    p.append(parse_xml(
+        f'<w:r {nsdecls("w")}><w:pict><w:txbxContent><w:p><w:r><w:t>«InBox»</w:t></w:r></w:p>'
+        f"</w:txbxContent></w:pict></w:r>"
+    ))
+    split = doc.add_paragraph()
+    split.add_run("«Spl")
+    split.add_run("it» & more")
+    path = tmp_path / "t.docx"
+    doc.save(path)
+
+    assert extract_placeholders_from_docx(path) == ["Split", "Sub_No"]
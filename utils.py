@@ -1,13 +1,31 @@
 import csv
+import io
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, suppress
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
+from tempfile import SpooledTemporaryFile, mkstemp
 import zipfile
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
 
+from flask import current_app, g, request
+from sqlalchemy import select
 from werkzeug.utils import secure_filename
 
 from db import db, Setting, Project, Submittal
 
+COPY_CHUNK = 1 << 20
+ZIP_COMPRESSLEVEL = 1
+KNOWN_COMPRESSED_EXT = {".pdf", ".docx", ".xlsx", ".zip", ".jpg", ".jpeg", ".png", ".gif", ".7z"}
+
+_export_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="log-export")
+_export_pending: Dict[int, Future] = {}
+_export_pending_lock = threading.Lock()
+
 
 def ensure_dirs():
     Path("storage").mkdir(parents=True, exist_ok=True)
@@ -16,12 +34,66 @@ def ensure_dirs():
     Path("scripts").mkdir(parents=True, exist_ok=True)
 
 
+def save_upload(upload, dest: Path) -> None:
+    """
+    Save a werkzeug FileStorage to dest.
+    Uploads werkzeug already spooled to disk are copied by the kernel (copy_file_range);
+    ones still held in memory, and non-Linux, use a chunked copy.
+    """
+    src = upload.stream
+    start = src.tell()
+    with open(dest, "wb") as dst:
+        if _on_disk(src):
+            try:
+                fd = src.fileno()
+                offset = start
+                while True:
+                    n = os.copy_file_range(fd, dst.fileno(), 1 << 30, offset)
+                    if not n:
+                        break
+                    offset += n
+                return
+            except (AttributeError, OSError):
+                dst.seek(0)
+                dst.truncate()
+                src.seek(start)
+        shutil.copyfileobj(src, dst, length=COPY_CHUNK)
+
+
+def _on_disk(stream) -> bool:
+    # fileno() on a SpooledTemporaryFile rolls it over, i.e. writes the whole upload out first
+    if isinstance(stream, SpooledTemporaryFile):
+        return stream._rolled
+    return not isinstance(stream, io.BytesIO)
+
+
+def save_uploads(pairs) -> None:
+    """
+    Save a batch of (FileStorage, dest) pairs collected by a request handler.
+    """
+    for upload, dest in pairs:
+        save_upload(upload, dest)
+
+
+def stripped_form() -> Dict[str, str]:
+    """
+    Snapshot request.form once as a plain dict of stripped values (first value per key).
+    """
+    return {k: (v or "").strip() for k, v in request.form.items()}
+
+
 def get_storage_root() -> str:
-    return Setting.get("storage_root") or str(Path.cwd() / "storage")
+    # cached on g so folder helpers don't re-query Setting for every row in a request
+    root = g.get("_storage_root")
+    if root is None:
+        root = Setting.get("storage_root") or str(Path.cwd() / "storage")
+        g._storage_root = root
+    return root
 
 
 def set_storage_root(path: str):
     Setting.set("storage_root", path)
+    g.pop("_storage_root", None)
     Path(path).mkdir(parents=True, exist_ok=True)
 
 
@@ -41,29 +113,58 @@ def name_format_options():
     ]
 
 
-def format_date(dt: datetime, fmt_key: str) -> str:
-    if fmt_key == "month_d_yyyy":
-        return dt.strftime("%B %d, %Y").replace(" 0", " ")
-    if fmt_key == "iso":
-        return dt.strftime("%Y-%m-%d")
+def _date_month_d_yyyy(dt: datetime) -> str:
+    return dt.strftime("%B %d, %Y").replace(" 0", " ")
+
+
+def _date_iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%d")
+
+
+def _date_mdy_slash(dt: datetime) -> str:
     return dt.strftime("%m/%d/%Y")
 
 
+_DATE_FORMATTERS = {
+    "mdy_slash": _date_mdy_slash,
+    "month_d_yyyy": _date_month_d_yyyy,
+    "iso": _date_iso,
+}
+
+
+def format_date(dt: datetime, fmt_key: str) -> str:
+    return _DATE_FORMATTERS.get(fmt_key, _date_mdy_slash)(dt)
+
+
+def _name_last_first(raw: str, parts: List[str]) -> str:
+    if len(parts) >= 2:
+        return f"{parts[-1]}, {' '.join(parts[:-1])}"
+    return raw
+
+
+def _name_mrms_last(raw: str, parts: List[str]) -> str:
+    first = parts[0].lower().rstrip(".")
+    if first in ("mr", "ms", "mrs", "dr"):
+        return f"{parts[0]} {parts[-1]}"
+    return f"Mr./Ms. {parts[-1]}"
+
+
+def _name_first_last(raw: str, parts: List[str]) -> str:
+    return raw
+
+
+_NAME_FORMATTERS = {
+    "first_last": _name_first_last,
+    "last_first": _name_last_first,
+    "mrms_last": _name_mrms_last,
+}
+
+
 def format_name(raw: str, fmt_key: str) -> str:
     raw = (raw or "").strip()
     if not raw:
         return ""
-    parts = raw.split()
-    if fmt_key == "last_first":
-        if len(parts) >= 2:
-            return f"{parts[-1]}, {' '.join(parts[:-1])}"
-        return raw
-    if fmt_key == "mrms_last":
-        first = parts[0].lower().rstrip(".")
-        if first in ("mr", "ms", "mrs", "dr"):
-            return f"{parts[0]} {parts[-1]}"
-        return f"Mr./Ms. {parts[-1]}"
-    return raw
+    return _NAME_FORMATTERS.get(fmt_key, _name_first_last)(raw, raw.split())
 
 
 def guess_field_type(key: str) -> str:
@@ -75,19 +176,48 @@ def guess_field_type(key: str) -> str:
     return "text"
 
 
-def parse_dropdown_options(options_text: str) -> List[str]:
+@lru_cache(maxsize=256)
+def parse_dropdown_options(options_text: str) -> Tuple[str, ...]:
+    # cached and shared between callers, hence a tuple
     if not options_text:
-        return []
-    return [ln.strip() for ln in options_text.splitlines() if ln.strip()]
+        return ()
+    return tuple(ln.strip() for ln in options_text.splitlines() if ln.strip())
 
 
 def project_folder(project: Project) -> Path:
-    storage_root = Path(get_storage_root())
-    return storage_root / "projects" / f"project_{project.id}_{secure_filename(project.name)}"
+    return _project_folder_cached(project.id, project.name, get_storage_root())
 
 
 def submittal_folder(project: Project, submittal: Submittal) -> Path:
-    return project_folder(project) / "Submittals" / secure_filename(submittal.sub_no)
+    return _submittal_folder_cached(project.id, project.name, get_storage_root(), submittal.sub_no)
+
+
+# keyed on everything the path is built from, so a renamed project or a new storage root
+# simply misses; Path is immutable, safe to share
+@lru_cache(maxsize=1024)
+def _project_folder_cached(project_id: int, name: str, storage_root: str) -> Path:
+    return Path(storage_root) / "projects" / f"project_{project_id}_{secure_filename(name)}"
+
+
+@lru_cache(maxsize=1024)
+def _submittal_folder_cached(project_id: int, name: str, storage_root: str, sub_no: str) -> Path:
+    return _project_folder_cached(project_id, name, storage_root) / "Submittals" / secure_filename(sub_no)
+
+
+@contextmanager
+def _replace_atomically(path: Path):
+    """
+    Open a temp file next to path for text writing; it replaces path only once fully written.
+    """
+    fd, tmp = mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
 
 
 def export_logs_csv(project_id: int) -> Dict[str, str]:
@@ -96,46 +226,132 @@ def export_logs_csv(project_id: int) -> Dict[str, str]:
     logs_dir = base / "Logs"
     logs_dir.mkdir(parents=True, exist_ok=True)
 
-    submittals = Submittal.query.filter_by(project_id=p.id).order_by(Submittal.created_at.asc()).all()
-
+    # plain column tuples, streamed; the log never needs Submittal objects
+    rows = db.session.execute(
+        select(
+            Submittal.sub_no, Submittal.title, Submittal.spec_section, Submittal.rev, Submittal.status,
+            Submittal.disposition, Submittal.responsible_person, Submittal.notes,
+        )
+        .where(Submittal.project_id == p.id)
+        .order_by(Submittal.created_at.asc())
+        .execution_options(yield_per=1000)
+    )
+
+    # written to a temp file and renamed over the log, so a download in progress
+    # (or a concurrent export) never sees a truncated file
     sub_path = logs_dir / "submittal_log.csv"
-    with sub_path.open("w", newline="", encoding="utf-8") as f:
+    with _replace_atomically(sub_path) as f:
         w = csv.writer(f)
         w.writerow([
             "Submittal No", "Title", "Spec Section", "Rev", "Status",
             "Sent Date", "Returned Date", "Disposition", "Responsible Person",
             "Notes"
         ])
-        for s in submittals:
+        for sub_no, title, spec_section, rev, status, disposition, responsible, notes in rows:
             w.writerow([
-                s.sub_no, s.title or "", s.spec_section or "", s.rev or "", s.status or "",
-                "", "", s.disposition or "", s.responsible_person or "",
-                (s.notes or "").replace("\n", " ").strip()
+                sub_no, title or "", spec_section or "", rev or "", status or "",
+                "", "", disposition or "", responsible or "",
+                (notes or "").replace("\n", " ").strip()
             ])
 
     trans_path = logs_dir / "transmittal_log.csv"
     if not trans_path.exists():
-        with trans_path.open("w", newline="", encoding="utf-8") as f:
+        with _replace_atomically(trans_path) as f:
             w = csv.writer(f)
             w.writerow(["Transmittal No", "Date Sent", "Sent To", "Delivery Method", "Related Submittals", "Notes"])
 
     return {"submittal": str(sub_path), "transmittal": str(trans_path)}
 
 
-def make_zip_for_submittal(submittal_id: int) -> str:
-    from db import Project, Submittal
-    s = db.session.get(Submittal, submittal_id)
-    p = db.session.get(Project, s.project_id)
-
-    sub_dir = submittal_folder(p, s)
-    zip_dir = Path(get_storage_root()) / "zips"
-    zip_dir.mkdir(parents=True, exist_ok=True)
-    zip_path = zip_dir / f"{secure_filename(p.name)}_{secure_filename(s.sub_no)}.zip"
-
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        if sub_dir.exists():
-            for file in sub_dir.rglob("*"):
-                if file.is_file():
-                    zf.write(file, arcname=str(file.relative_to(sub_dir)))
-
-    return str(zip_path)
+def _export_logs_in_context(app, project_id: int) -> None:
+    with app.app_context():
+        try:
+            export_logs_csv(project_id)
+        except Exception:
+            app.logger.exception("Log export failed for project %s", project_id)
+
+
+def schedule_export_logs_csv(project_id: int) -> Future:
+    """
+    Rebuild the project's CSV logs on a worker thread so the request can return.
+    An export that is queued but not started yet will already see this commit, so reuse it.
+    """
+    app = current_app._get_current_object()
+    with _export_pending_lock:
+        fut = _export_pending.get(project_id)
+        if fut is not None and not fut.running() and not fut.done():
+            return fut
+        fut = _export_pool.submit(_export_logs_in_context, app, project_id)
+        _export_pending[project_id] = fut
+        return fut
+
+
+def _walk_files(root: str) -> Iterator[os.DirEntry]:
+    # DirEntry.is_dir/is_file answer from the directory listing, no stat per file
+    with os.scandir(root) as it:
+        for de in it:
+            if de.is_dir(follow_symlinks=False):
+                yield from _walk_files(de.path)
+            elif de.is_file(follow_symlinks=False):
+                yield de
+
+
+def submittal_zip_entries(project: Project, submittal: Submittal) -> List[Tuple[str, str]]:
+    sub_dir = str(submittal_folder(project, submittal))
+    if not os.path.isdir(sub_dir):
+        return []
+    return [(de.path, os.path.relpath(de.path, sub_dir)) for de in _walk_files(sub_dir)]
+
+
+class _ZipSink(io.RawIOBase):
+    """
+    Write-only, non-seekable sink: ZipFile falls back to data descriptors
+    and we hand out whatever it has written so far.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries: List[Tuple[str, str]]) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of (path, arcname) entries chunk by chunk, without a temp file.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname in entries:
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            # PDFs/DOCX/images are already DEFLATEd; re-compressing them is CPU for nothing
+            if Path(path).suffix.lower() in KNOWN_COMPRESSED_EXT:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                # zf.open(zinfo, "w") takes the level from the ZipInfo, not the ZipFile;
+                # it is only public (compress_level) from 3.13
+                if hasattr(zinfo, "compress_level"):
+                    zinfo.compress_level = ZIP_COMPRESSLEVEL
+                else:
+                    zinfo._compresslevel = ZIP_COMPRESSLEVEL
+            with open(path, "rb") as src, zf.open(zinfo, "w", force_zip64=True) as dst:
+                while True:
+                    buf = src.read(COPY_CHUNK)
+                    if not buf:
+                        break
+                    dst.write(buf)
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            yield sink.drain()
+    yield sink.drain()